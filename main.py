@@ -1,15 +1,39 @@
 import os
+import asyncio
+import re
+import logging
+from functools import lru_cache
 from typing import List, Optional, Literal, Any, Dict
-from datetime import datetime, timezone
-from fastapi import FastAPI, HTTPException, Depends, Request
+from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.datastructures import MutableHeaders
+import orjson
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.coder import PickleCoder
+from fastapi_cache.decorator import cache
+from fastapi_cache.key_builder import default_key_builder
+from fastapi_limiter import FastAPILimiter
+from fastapi_limiter.depends import RateLimiter
+import redis.asyncio as aioredis
 from pydantic import BaseModel, Field, EmailStr
 from bson import ObjectId
+from bson.errors import InvalidId
+from bson.regex import Regex
+from pymongo import ReturnDocument, WriteConcern
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
 
 from database import db, create_document, get_documents
+from schemas import ProductType, OrderStatus, DepositStatus
 from schemas import User as UserSchema, Category as CategorySchema, Product as ProductSchema, PaymentMethod as PaymentMethodSchema, Order as OrderSchema, Rating as RatingSchema, Deposit as DepositSchema, ProviderConfig as ProviderConfigSchema
 
-app = FastAPI(title="Vechnost API")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Vechnost API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,6 +42,158 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+redis_url = os.getenv("REDIS_URL")
+
+def request_key_builder(func, namespace: str = "", request: Request = None, response: Response = None, args=None, kwargs=None) -> str:
+    # Key on the route path and the handler's bound params: aliased routes stay apart,
+    # while unknown query params (junk, cache-busters) don't mint new entries
+    if request is None:
+        return default_key_builder(func, namespace, request=request, response=response, args=args, kwargs=kwargs)
+    params = "&".join(f"{k}={v}" for k, v in sorted((kwargs or {}).items()))
+    return f"{FastAPICache.get_prefix()}:{namespace}:{request.url.path}?{params}"
+
+@app.on_event("startup")
+async def init_cache():
+    # Shared Redis cache and rate limits when configured; per-worker memory cache otherwise.
+    # PickleCoder round-trips values exactly, so a hit returns the same data as a miss.
+    if redis_url:
+        redis_client = aioredis.from_url(redis_url)
+        FastAPICache.init(RedisBackend(redis_client), prefix="vechnost", coder=PickleCoder, key_builder=request_key_builder)
+        await FastAPILimiter.init(redis_client)
+    else:
+        FastAPICache.init(InMemoryBackend(), prefix="vechnost", coder=PickleCoder, key_builder=request_key_builder)
+
+# Public listings that clients and CDNs may reuse; fastapi-cache only sets max-age
+PUBLIC_CACHE_PATHS = {"/api/categories", "/api/payment-methods"}
+
+class PublicCacheControlMiddleware:
+    """Pure ASGI: other paths pass straight through, matching ones get a header rewrite"""
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_public(message):
+            if message["type"] == "http.response.start" and message["status"] in (200, 304):
+                headers = MutableHeaders(scope=message)
+                headers["Cache-Control"] = f"public, {headers.get('Cache-Control', 'max-age=30')}"
+            await send(message)
+
+        await self.app(scope, receive, send_public)
+
+app.add_middleware(PublicCacheControlMiddleware, paths=PUBLIC_CACHE_PATHS)
+
+_read_limiter = RateLimiter(times=120, seconds=60)
+
+async def read_rate_limit(request: Request, response: Response):
+    # Rate limiting needs Redis; without it reads are not throttled
+    if FastAPILimiter.redis is not None:
+        await _read_limiter(request, response)
+
+@app.on_event("startup")
+async def ensure_indexes():
+    if db is None:
+        return
+    # Case-sensitive so anchored (^prefix) title searches become index range scans
+    await db["product"].create_index([("title", 1)])
+    await db["product"].create_index([("tags", 1)])
+    await db["product"].create_index(
+        [("title", "text"), ("description", "text"), ("tags", "text")],
+        weights={"title": 10, "tags": 5, "description": 1},
+    )
+    # Equality fields first, sort field last
+    await db["order"].create_index([("user_id", 1), ("status", 1), ("created_at", -1)])
+    await db["order"].create_index([("status", 1)])
+    await db["order"].create_index([("payment_reference", 1)], sparse=True)
+    # Pending orders are the hot queue; keep a small index over just those
+    await db["order"].create_index(
+        [("created_at", -1)],
+        name="pending_created_at",
+        partialFilterExpression={"status": "pending"},
+    )
+    await db["deposit"].create_index([("user_id", 1), ("status", 1)])
+    await db["rating"].create_index([("product_id", 1)])
+    await db["paymentmethod"].create_index([("code", 1), ("is_active", 1)])
+    try:
+        await db["user"].create_index([("email", 1)], unique=True)
+    except OperationFailure as e:
+        # Older check-then-insert registrations may have stored duplicate emails (or a
+        # non-unique email_1 index exists); keep booting with a plain index until cleaned up
+        logger.warning("Unique index on user.email not created, falling back to non-unique: %s", e)
+        await db["user"].create_index([("email", 1)])
+    await db["topranking"].create_index([("product_id", 1)], unique=True)
+    await db["topranking"].create_index([("orders", -1)])
+    await backfill_topranking()
+
+# A claimed backfill that has not finished by then is assumed dead and may be retaken
+BACKFILL_STALE_AFTER = timedelta(minutes=10)
+
+async def backfill_topranking():
+    """Fold orders created before the ranking counters existed into topranking, once"""
+    now = datetime.now(timezone.utc)
+    # Claim the marker atomically: only one process runs it, a finished run (done_at set)
+    # is never repeated, and a stale unfinished claim from a dead process can be retaken
+    try:
+        await db["migration"].find_one_and_update(
+            {"_id": "topranking_backfill", "done_at": None, "started_at": {"$lt": now - BACKFILL_STALE_AFTER}},
+            {"$set": {"started_at": now, "done_at": None}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return
+    try:
+        # Orders flagged in_ranking were counted live by create_order. The legacy share of
+        # each counter is kept in backfill_orders/backfill_revenue and replaced, not added,
+        # so rerunning after a partial $merge recomputes it instead of double-counting.
+        await db["order"].aggregate([
+            {"$match": {"in_ranking": {"$ne": True}}},
+            {"$group": {
+                "_id": "$product_id",
+                "orders": {"$sum": 1},
+                "revenue": {"$sum": "$total_price"},
+                "last_order_at": {"$max": "$created_at"},
+            }},
+            {"$project": {
+                "_id": 0,
+                "product_id": "$_id",
+                "orders": 1,
+                "revenue": 1,
+                "last_order_at": 1,
+                "backfill_orders": "$orders",
+                "backfill_revenue": "$revenue",
+            }},
+            {"$merge": {
+                "into": "topranking",
+                "on": "product_id",
+                "whenMatched": [{"$set": {
+                    "orders": {"$add": [
+                        {"$subtract": ["$orders", {"$ifNull": ["$backfill_orders", 0]}]}, "$$new.orders",
+                    ]},
+                    "revenue": {"$add": [
+                        {"$subtract": ["$revenue", {"$ifNull": ["$backfill_revenue", 0]}]}, "$$new.revenue",
+                    ]},
+                    "last_order_at": {"$max": ["$last_order_at", "$$new.last_order_at"]},
+                    "backfill_orders": "$$new.orders",
+                    "backfill_revenue": "$$new.revenue",
+                }}],
+                "whenNotMatched": "insert",
+            }},
+        ]).to_list(length=None)
+    except Exception:
+        # Release the claim so the next boot retries; the app still starts meanwhile
+        logger.exception("topranking backfill failed; will retry on next startup")
+        await db["migration"].delete_one({"_id": "topranking_backfill", "started_at": now})
+        return
+    await db["migration"].update_one(
+        {"_id": "topranking_backfill"}, {"$set": {"done_at": datetime.now(timezone.utc)}}
+    )
 
 # Helpers
 class PyObjectId(ObjectId):
@@ -29,29 +205,88 @@ class PyObjectId(ObjectId):
     def validate(cls, v):
         if isinstance(v, ObjectId):
             return v
-        if not ObjectId.is_valid(v):
+        try:
+            return ObjectId(v)
+        except (InvalidId, TypeError):
             raise ValueError("Invalid ObjectId")
-        return ObjectId(v)
 
 def oid(s: str) -> ObjectId:
     try:
         return ObjectId(s)
-    except Exception:
+    except (InvalidId, TypeError):
         raise HTTPException(status_code=400, detail="Invalid id")
 
+# Emits the string id from the server so listings need no per-document rewrite
+ID_PROJECTION = {"_id": 0, "id": {"$toString": "$_id"}}
+
+def listing_projection(schema, exclude=()) -> dict:
+    """String id, the schema's fields and the create_document timestamps"""
+    projection = {**ID_PROJECTION, "created_at": 1, "updated_at": 1}
+    projection.update({f: 1 for f in schema.model_fields if f not in exclude})
+    return projection
+
+async def stream_documents(cursor, first_batch: int = 101) -> StreamingResponse:
+    """Serialize a cursor as a JSON array one document at a time"""
+    # Run the query before the 200 is sent so query errors still surface as a 500
+    head = await cursor.to_list(length=first_batch)
+
+    async def body():
+        sep = b"["
+        for doc in head:
+            yield sep + orjson.dumps(doc)
+            sep = b","
+        if len(head) == first_batch:
+            async for doc in cursor:
+                yield sep + orjson.dumps(doc)
+                sep = b","
+        yield b"[]" if sep == b"[" else b"]"
+    return StreamingResponse(body(), media_type="application/json")
+
 # Basic security (very simple for demo)
 import hashlib
+import hmac
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerifyMismatchError
+
+# BLAKE2b keys are limited to 64 bytes
+SECRET_KEY = os.getenv("SECRET_KEY", "vechnost-dev-secret").encode()[:64]
+
+ph = PasswordHasher()
+# Verified against when the email is unknown, so failed logins cost the same either way
+DUMMY_PASSWORD_HASH = ph.hash(os.urandom(16).hex())
 
 def hash_password(pw: str) -> str:
-    return hashlib.sha256(pw.encode()).hexdigest()
+    return ph.hash(pw)
+
+def verify_password(stored: str, pw: str) -> bool:
+    if stored.startswith("$argon2"):
+        try:
+            return ph.verify(stored, pw)
+        except (VerifyMismatchError, InvalidHashError):
+            return False
+    # Unsalted BLAKE2b / SHA-256 digests stored before the switch to argon2
+    return (
+        hmac.compare_digest(stored, hashlib.blake2b(pw.encode(), digest_size=32).hexdigest())
+        or hmac.compare_digest(stored, hashlib.sha256(pw.encode()).hexdigest())
+    )
+
+def password_needs_rehash(stored: str) -> bool:
+    return not stored.startswith("$argon2") or ph.check_needs_rehash(stored)
+
+async def run_in_thread(fn, *args):
+    """Run CPU-bound work (password KDF) without blocking the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+def make_token(user_id: ObjectId) -> str:
+    return hashlib.blake2b(str(user_id).encode(), digest_size=16, key=SECRET_KEY).hexdigest()
 
 # ---------- Basic endpoints ----------
 @app.get("/")
-def read_root():
+async def read_root():
     return {"name": "Vechnost", "message": "Backend running"}
 
 @app.get("/test")
-def test_database():
+async def test_database():
     info = {
         "backend": "ok",
         "database": "not-configured",
@@ -60,7 +295,7 @@ def test_database():
     try:
         if db is not None:
             info["database"] = "connected"
-            info["collections"] = db.list_collection_names()
+            info["collections"] = await db.list_collection_names()
         else:
             info["database"] = "not-available"
     except Exception as e:
@@ -79,198 +314,241 @@ class LoginIn(BaseModel):
     password: str
 
 @app.post("/api/auth/register")
-def register(payload: RegisterIn):
-    if db["user"].find_one({"email": payload.email}):
+async def register(payload: RegisterIn):
+    if await db["user"].find_one({"email": payload.email}):
         raise HTTPException(status_code=400, detail="Email already registered")
     user = UserSchema(
         name=payload.name,
         email=payload.email,
-        password_hash=hash_password(payload.password),
+        password_hash=await run_in_thread(hash_password, payload.password),
         phone=payload.phone,
         level="member",
         is_active=True,
     )
-    new_id = create_document("user", user)
+    try:
+        new_id = await create_document("user", user)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent signup for the same email
+        raise HTTPException(status_code=400, detail="Email already registered")
     return {"id": new_id, "message": "Registered"}
 
 @app.post("/api/auth/login")
-def login(payload: LoginIn):
-    user = db["user"].find_one({"email": payload.email})
-    if not user or user.get("password_hash") != hash_password(payload.password):
+async def login(payload: LoginIn):
+    user = await db["user"].find_one({"email": payload.email})
+    stored = user.get("password_hash", "") if user else ""
+    valid = await run_in_thread(verify_password, stored or DUMMY_PASSWORD_HASH, payload.password)
+    if not user or not stored or not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    # For demo, token is user id hash; in production use JWT
-    token = hashlib.sha256(str(user["_id"]).encode()).hexdigest()
+    if password_needs_rehash(stored):
+        new_hash = await run_in_thread(hash_password, payload.password)
+        await db["user"].update_one({"_id": user["_id"]}, {"$set": {"password_hash": new_hash}})
+    # For demo, token is a keyed hash of the user id; in production use JWT
+    token = make_token(user["_id"])
     return {"token": token, "user": {"id": str(user["_id"]), "name": user.get("name"), "level": user.get("level")}}
 
 # ---------- Admin CRUD (no auth gating for demo) ----------
 
 # Categories
 @app.post("/api/admin/categories")
-def admin_create_category(cat: CategorySchema):
-    new_id = create_document("category", cat)
+async def admin_create_category(cat: CategorySchema):
+    new_id = await create_document("category", cat)
+    await FastAPICache.clear(namespace="category")
     return {"id": new_id}
 
-@app.get("/api/admin/categories")
-@app.get("/api/categories")
-def list_categories():
-    items = get_documents("category")
-    for it in items:
-        it["id"] = str(it.pop("_id"))
-    return items
+@app.get("/api/admin/categories", dependencies=[Depends(read_rate_limit)])
+@app.get("/api/categories", dependencies=[Depends(read_rate_limit)])
+@cache(expire=30, namespace="category")
+async def list_categories():
+    return await get_documents("category", projection=listing_projection(CategorySchema))
 
 @app.delete("/api/admin/categories/{category_id}")
-def delete_category(category_id: str):
-    res = db["category"].delete_one({"_id": oid(category_id)})
+async def delete_category(category_id: str):
+    res = await db["category"].delete_one({"_id": oid(category_id)})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Not found")
+    await FastAPICache.clear(namespace="category")
     return {"deleted": True}
 
 # Products
 @app.post("/api/admin/products")
-def admin_create_product(prod: ProductSchema):
-    new_id = create_document("product", prod)
+async def admin_create_product(prod: ProductSchema):
+    new_id = await create_document("product", prod)
     return {"id": new_id}
 
-@app.get("/api/products")
-def list_products(category: Optional[str] = None, q: Optional[str] = None, type: Optional[str] = None):
+@lru_cache(maxsize=256)
+def prefix_regex(q: str) -> Regex:
+    # Anchored and case-sensitive so the title index can serve it as a range scan
+    return Regex(f"^{re.escape(q)}", "")
+
+# Fields returned by product listings
+PRODUCT_LIST_PROJECTION = {
+    **ID_PROJECTION,
+    "title": 1, "price": 1, "type": 1, "provider": 1, "is_active": 1, "tags": 1, "category_id": 1,
+}
+
+@app.get("/api/products", dependencies=[Depends(read_rate_limit)])
+async def list_products(category: Optional[str] = None, q: Optional[str] = None, type: Optional[ProductType] = None, prefix: bool = False):
     filt: Dict[str, Any] = {}
     if category:
         filt["category_id"] = category
     if type:
         filt["type"] = type
-    if q:
+    if q and prefix:
+        # Literal prefix lookup
         filt["$or"] = [
-            {"title": {"$regex": q, "$options": "i"}},
-            {"description": {"$regex": q, "$options": "i"}},
-            {"tags": {"$regex": q, "$options": "i"}},
+            {"title": prefix_regex(q)},
+            {"tags": {"$in": q.split()}},
         ]
-    items = get_documents("product", filt)
-    for it in items:
-        it["id"] = str(it.pop("_id"))
-    return items
+    elif q:
+        filt["$text"] = {"$search": q}
+    cursor = db["product"].find(filt, PRODUCT_LIST_PROJECTION)
+    if "$text" in filt:
+        cursor = cursor.sort([("score", {"$meta": "textScore"})])
+    return await stream_documents(cursor)
 
 @app.delete("/api/admin/products/{product_id}")
-def delete_product(product_id: str):
-    res = db["product"].delete_one({"_id": oid(product_id)})
+async def delete_product(product_id: str):
+    res = await db["product"].delete_one({"_id": oid(product_id)})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Not found")
     return {"deleted": True}
 
 # Users (admin)
 @app.get("/api/admin/users")
-def admin_list_users():
-    items = get_documents("user")
-    for it in items:
-        it["id"] = str(it.pop("_id"))
-        it.pop("password_hash", None)
-    return items
+async def admin_list_users():
+    projection = listing_projection(UserSchema, exclude=("password_hash",))
+    return await stream_documents(db["user"].find({}, projection))
 
 @app.delete("/api/admin/users/{user_id}")
-def admin_delete_user(user_id: str):
-    res = db["user"].delete_one({"_id": oid(user_id)})
+async def admin_delete_user(user_id: str):
+    res = await db["user"].delete_one({"_id": oid(user_id)})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Not found")
     return {"deleted": True}
 
 # Payment Methods
 @app.post("/api/admin/payment-methods")
-def admin_create_payment_method(pm: PaymentMethodSchema):
-    new_id = create_document("paymentmethod", pm)
+async def admin_create_payment_method(pm: PaymentMethodSchema):
+    new_id = await create_document("paymentmethod", pm)
+    await FastAPICache.clear(namespace="paymentmethod")
     return {"id": new_id}
 
-@app.get("/api/payment-methods")
-def list_payment_methods():
-    items = get_documents("paymentmethod", {"is_active": True})
-    for it in items:
-        it["id"] = str(it.pop("_id"))
-    return items
+@app.get("/api/payment-methods", dependencies=[Depends(read_rate_limit)])
+@cache(expire=30, namespace="paymentmethod")
+async def list_payment_methods():
+    return await get_documents("paymentmethod", {"is_active": True}, projection=listing_projection(PaymentMethodSchema))
 
 @app.delete("/api/admin/payment-methods/{method_id}")
-def admin_delete_payment_method(method_id: str):
-    res = db["paymentmethod"].delete_one({"_id": oid(method_id)})
+async def admin_delete_payment_method(method_id: str):
+    res = await db["paymentmethod"].delete_one({"_id": oid(method_id)})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Not found")
+    await FastAPICache.clear(namespace="paymentmethod")
     return {"deleted": True}
 
 # Provider Configs and bulk add from providers (mock)
 @app.post("/api/admin/providers")
-def admin_add_provider(cfg: ProviderConfigSchema):
-    new_id = create_document("providerconfig", cfg)
+async def admin_add_provider(cfg: ProviderConfigSchema):
+    new_id = await create_document("providerconfig", cfg)
     return {"id": new_id}
 
+# Keeps each insert_many batch well under the 16 MB BSON limit
+BULK_CHUNK_SIZE = 1000
+
 class BulkAddIn(BaseModel):
     provider: Literal["vip", "digiflazz"]
     items: List[dict] = Field(default_factory=list)
 
 @app.post("/api/admin/products/bulk-add")
-def admin_bulk_add_products(payload: BulkAddIn):
+async def admin_bulk_add_products(payload: BulkAddIn, ack: bool = False):
     if not payload.items:
         raise HTTPException(status_code=400, detail="No items provided")
-    docs = []
     now = datetime.now(timezone.utc)
-    for it in payload.items:
-        doc = {
-            "title": it.get("title") or it.get("name") or "Produk",
-            "description": it.get("description"),
-            "price": float(it.get("price", 0)),
-            "category_id": it.get("category_id"),
-            "type": it.get("type") or "game_topup",
-            "provider": payload.provider,
+    prov = payload.provider
+
+    def build(it: dict) -> dict:
+        get = it.get
+        return {
+            "title": get("title") or get("name") or "Produk",
+            "description": get("description"),
+            "price": float(get("price") or 0),
+            "category_id": get("category_id"),
+            "type": get("type") or "game_topup",
+            "provider": prov,
             "is_active": True,
-            "tags": it.get("tags", []),
+            "tags": get("tags") or [],
             "created_at": now,
             "updated_at": now,
         }
-        docs.append(doc)
-    res = db["product"].insert_many(docs)
-    return {"inserted": len(res.inserted_ids)}
+
+    docs = list(map(build, payload.items))
+    # Unacknowledged, unordered writes by default; ?ack=1 waits for the server
+    coll = db["product"] if ack else db["product"].with_options(write_concern=WriteConcern(w=0))
+    inserted = 0
+    for i in range(0, len(docs), BULK_CHUNK_SIZE):
+        res = await coll.insert_many(docs[i:i + BULK_CHUNK_SIZE], ordered=False)
+        inserted += len(res.inserted_ids)
+    return {"inserted": inserted}
 
 # ---------- Orders, Payments, Ratings, Deposits ----------
 
 @app.post("/api/orders")
-def create_order(order: OrderSchema):
-    # Price calculation
-    prod = db["product"].find_one({"_id": oid(order.product_id)})
+async def create_order(order: OrderSchema):
+    # Product and payment method lookups are independent; run them together
+    lookups = [db["product"].find_one({"_id": oid(order.product_id)})]
+    if order.payment_method_code:
+        lookups.append(db["paymentmethod"].find_one({"code": order.payment_method_code, "is_active": True}))
+    prod, *rest = await asyncio.gather(*lookups)
+    pm = rest[0] if rest else None
     if not prod:
         raise HTTPException(status_code=404, detail="Product not found")
+    # Price calculation
     base = float(prod.get("price", 0)) * int(order.amount)
     total = base
-    pm = None
-    if order.payment_method_code:
-        pm = db["paymentmethod"].find_one({"code": order.payment_method_code, "is_active": True})
-        if pm:
-            total = base + base * float(pm.get("fee_percent", 0)) / 100.0 + float(pm.get("fee_flat", 0))
+    if pm:
+        total = base + base * float(pm.get("fee_percent", 0)) / 100.0 + float(pm.get("fee_flat", 0))
+    now = datetime.now(timezone.utc)
     payload = order.model_dump()
     payload.update({
         "status": "pending",
         "provider": order.provider or prod.get("provider") or "manual",
         "total_price": round(total, 2),
-        "created_at": datetime.now(timezone.utc),
-        "updated_at": datetime.now(timezone.utc),
+        "created_at": now,
+        "updated_at": now,
+        # Counted by the topranking upsert below, so the backfill skips it
+        "in_ranking": True,
     })
-    order_id = db["order"].insert_one(payload).inserted_id
+    # Id is generated client-side so the payment URL can go in the same insert
+    order_id = ObjectId()
+    payload["_id"] = order_id
 
     # Mock payment URL for Tripay/Tokopay
     pay_url = None
     if pm and pm.get("gateway") in ("tripay", "tokopay"):
         pay_url = f"https://pay.mock/{pm['gateway']}/{order_id}"
-        db["order"].update_one({"_id": order_id}, {"$set": {"payment_url": pay_url}})
+        payload["payment_url"] = pay_url
+    await db["order"].insert_one(payload)
+
+    # The order is already stored; a counter failure must not fail the checkout
+    try:
+        await db["topranking"].update_one(
+            {"product_id": order.product_id},
+            {"$inc": {"orders": 1, "revenue": payload["total_price"]}, "$set": {"last_order_at": now}},
+            upsert=True,
+        )
+    except PyMongoError:
+        logger.exception("Failed to update topranking for order %s", order_id)
 
     return {"id": str(order_id), "payment_url": pay_url, "total_price": payload["total_price"]}
 
 @app.get("/api/orders")
-def list_orders(status: Optional[str] = None, user_id: Optional[str] = None):
+async def list_orders(status: Optional[OrderStatus] = None, user_id: Optional[str] = None):
     filt: Dict[str, Any] = {}
     if status:
         filt["status"] = status
     if user_id:
         filt["user_id"] = user_id
-    items = get_documents("order", filt)
-    out = []
-    for it in items:
-        it["id"] = str(it.pop("_id"))
-        out.append(it)
-    return out
+    return await stream_documents(db["order"].find(filt, listing_projection(OrderSchema)))
 
 # Webhooks (mock: mark paid)
 class WebhookIn(BaseModel):
@@ -279,55 +557,54 @@ class WebhookIn(BaseModel):
 
 @app.post("/api/payment/tripay/webhook")
 @app.post("/api/payment/tokopay/webhook")
-def payment_webhook(payload: WebhookIn, request: Request):
+async def payment_webhook(payload: WebhookIn, request: Request):
     ref = payload.reference or request.query_params.get("reference")
     if not ref:
         raise HTTPException(status_code=400, detail="Missing reference")
-    order = db["order"].find_one({"payment_reference": ref})
+    update = {"$set": {"status": payload.status, "updated_at": datetime.now(timezone.utc)}}
+    # payment_reference wins over the _id fallback, so match it first; each step is atomic
+    order = await db["order"].find_one_and_update(
+        {"payment_reference": ref}, update, return_document=ReturnDocument.AFTER
+    )
     if not order:
         # allow direct id too
         try:
-            order = db["order"].find_one({"_id": oid(ref)})
-        except Exception:
+            order = await db["order"].find_one_and_update(
+                {"_id": ObjectId(ref)}, update, return_document=ReturnDocument.AFTER
+            )
+        except InvalidId:
             order = None
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    db["order"].update_one({"_id": order["_id"]}, {"$set": {"status": payload.status, "updated_at": datetime.now(timezone.utc)}})
     return {"ok": True}
 
 # Ratings
 @app.post("/api/ratings")
-def create_rating(r: RatingSchema):
+async def create_rating(r: RatingSchema):
     # basic validation
-    if not db["product"].find_one({"_id": oid(r.product_id)}):
+    if not await db["product"].find_one({"_id": oid(r.product_id)}):
         raise HTTPException(status_code=404, detail="Product not found")
-    new_id = create_document("rating", r)
+    new_id = await create_document("rating", r)
     return {"id": new_id}
 
 @app.get("/api/ratings/{product_id}")
-def list_ratings(product_id: str):
-    items = get_documents("rating", {"product_id": product_id})
-    for it in items:
-        it["id"] = str(it.pop("_id"))
-    return items
+async def list_ratings(product_id: str):
+    return await get_documents("rating", {"product_id": product_id}, projection=listing_projection(RatingSchema))
 
 # Deposits
 @app.post("/api/deposits")
-def create_deposit(dep: DepositSchema):
-    new_id = create_document("deposit", dep)
+async def create_deposit(dep: DepositSchema):
+    new_id = await create_document("deposit", dep)
     return {"id": new_id}
 
 @app.get("/api/deposits")
-def list_deposits(user_id: Optional[str] = None, status: Optional[str] = None):
+async def list_deposits(user_id: Optional[str] = None, status: Optional[DepositStatus] = None):
     filt: Dict[str, Any] = {}
     if user_id:
         filt["user_id"] = user_id
     if status:
         filt["status"] = status
-    items = get_documents("deposit", filt)
-    for it in items:
-        it["id"] = str(it.pop("_id"))
-    return items
+    return await get_documents("deposit", filt, projection=listing_projection(DepositSchema))
 
 # ---------- Tools & Top Ranking ----------
 class CheckIdIn(BaseModel):
@@ -336,7 +613,7 @@ class CheckIdIn(BaseModel):
     server: Optional[str] = None
 
 @app.post("/api/tools/check-game-id")
-def check_game_id(payload: CheckIdIn):
+async def check_game_id(payload: CheckIdIn):
     # Mock check; in production call provider API
     if len(payload.user_id.strip()) < 3:
         return {"valid": False, "message": "ID terlalu pendek"}
@@ -351,25 +628,26 @@ class CalcIn(BaseModel):
     fee_flat: float = 0.0
 
 @app.post("/api/tools/calc")
-def calc_total(payload: CalcIn):
+async def calc_total(payload: CalcIn):
     base = payload.price * payload.amount
     total = base + base * payload.fee_percent / 100.0 + payload.fee_flat
     return {"base": round(base, 2), "total": round(total, 2)}
 
-@app.get("/api/top")
-def top_ranking(limit: int = 10):
-    pipeline = [
-        {"$group": {"_id": "$product_id", "orders": {"$sum": 1}, "revenue": {"$sum": "$total_price"}}},
-        {"$sort": {"orders": -1}},
-        {"$limit": limit},
-    ]
-    res = list(db["order"].aggregate(pipeline))
+@app.get("/api/top", dependencies=[Depends(read_rate_limit)])
+@cache(expire=60, namespace="top")
+async def top_ranking(limit: int = Query(10, ge=1, le=100)):
+    # Counters are maintained by create_order, so this is an index walk, not a scan of orders
+    res = await db["topranking"].find({}, {"_id": 0}).sort("orders", -1).limit(limit).to_list(length=limit)
+    ids = [oid(r["product_id"]) for r in res if r.get("product_id")]
+    titles = {
+        str(p["_id"]): p.get("title")
+        async for p in db["product"].find({"_id": {"$in": ids}}, {"title": 1})
+    }
     out = []
     for r in res:
-        prod = db["product"].find_one({"_id": oid(r["_id"])}) if r.get("_id") else None
         out.append({
-            "product_id": r.get("_id"),
-            "product_title": prod.get("title") if prod else None,
+            "product_id": r.get("product_id"),
+            "product_title": titles.get(r.get("product_id")),
             "orders": r.get("orders", 0),
             "revenue": round(float(r.get("revenue", 0) or 0), 2),
         })
@@ -377,17 +655,29 @@ def top_ranking(limit: int = 10):
 
 # ---------- Admin Monitoring ----------
 @app.get("/api/admin/overview")
-def admin_overview():
+async def admin_overview():
+    # Unfiltered totals come from collection metadata; all reads run concurrently
+    users, products, orders, deposits, pending_orders, paid_orders, recent = await asyncio.gather(
+        db["user"].estimated_document_count(),
+        db["product"].estimated_document_count(),
+        db["order"].estimated_document_count(),
+        db["deposit"].estimated_document_count(),
+        db["order"].count_documents({"status": "pending"}),
+        db["order"].count_documents({"status": "paid"}),
+        db["order"].find(
+            {}, {"user_id": 1, "product_id": 1, "status": 1, "total_price": 1, "created_at": 1}
+        ).sort("created_at", -1).limit(10).to_list(10),
+    )
     return {
-        "users": db["user"].count_documents({}),
-        "products": db["product"].count_documents({}),
-        "orders": db["order"].count_documents({}),
-        "deposits": db["deposit"].count_documents({}),
-        "pending_orders": db["order"].count_documents({"status": "pending"}),
-        "paid_orders": db["order"].count_documents({"status": "paid"}),
+        "users": users,
+        "products": products,
+        "orders": orders,
+        "deposits": deposits,
+        "pending_orders": pending_orders,
+        "paid_orders": paid_orders,
         "recent_orders": [
             {**{k: (str(v) if k == "_id" else v) for k, v in o.items()}}
-            for o in db["order"].find().sort("created_at", -1).limit(10)
+            for o in recent
         ],
     }
 
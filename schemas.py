@@ -9,6 +9,13 @@ from pydantic import BaseModel, Field, EmailStr
 from typing import Optional, List, Literal
 from datetime import datetime
 
+# Shared value domains, also used to constrain list filters in the API
+ProductType = Literal[
+    "game_topup", "pulsa", "data", "joki_ml", "joki_roblox", "voucher", "premium_account"
+]
+OrderStatus = Literal["pending", "paid", "processing", "success", "failed", "refunded"]
+DepositStatus = Literal["pending", "paid", "failed"]
+
 # User levels: guest, member, vip, admin
 class User(BaseModel):
     name: str = Field(..., description="Full name")
@@ -29,9 +36,7 @@ class Product(BaseModel):
     description: Optional[str] = Field(None, description="Product description")
     price: float = Field(..., ge=0, description="Base price")
     category_id: Optional[str] = Field(None, description="Related category id")
-    type: Literal[
-        "game_topup", "pulsa", "data", "joki_ml", "joki_roblox", "voucher", "premium_account"
-    ] = Field("game_topup", description="Product type")
+    type: ProductType = Field("game_topup", description="Product type")
     provider: Optional[Literal["vip", "digiflazz", "manual"]] = Field("manual", description="Fulfillment provider")
     is_active: bool = Field(True, description="Whether product is active")
     tags: List[str] = Field(default_factory=list, description="Search tags")
@@ -49,7 +54,7 @@ class Order(BaseModel):
     product_id: str = Field(..., description="Product ID")
     amount: int = Field(1, ge=1, description="Quantity or units")
     target_id: Optional[str] = Field(None, description="Game/account target identifier")
-    status: Literal["pending", "paid", "processing", "success", "failed", "refunded"] = "pending"
+    status: OrderStatus = "pending"
     provider: Optional[Literal["vip", "digiflazz", "manual"]] = None
     payment_method_code: Optional[str] = None
     payment_reference: Optional[str] = None
@@ -66,7 +71,7 @@ class Rating(BaseModel):
 class Deposit(BaseModel):
     user_id: str
     amount: float = Field(..., ge=0)
-    status: Literal["pending", "paid", "failed"] = "pending"
+    status: DepositStatus = "pending"
     method_code: Optional[str] = None
     reference: Optional[str] = None
 